@@ -1,37 +1,43 @@
 import os
 import time
-import json
+import functools
+import hashlib
+import orjson
 from typing import Dict, List, Optional, Union, AsyncGenerator
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from cerebras.cloud.sdk import Cerebras
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from cerebras.cloud.sdk import AsyncCerebras
 import uvicorn
 
-app = FastAPI(title="Cerebras-Ollama Wrapper", version="1.0.0")
+app = FastAPI(title="Cerebras-Ollama Wrapper", version="1.0.0", default_response_class=ORJSONResponse)
 
+_dumps = orjson.dumps
+
+# Coalesce upstream deltas so fast generation doesn't mean one write per token
+STREAM_CHUNK_TOKENS = int(os.environ.get("STREAM_CHUNK_TOKENS", 8))
+STREAM_CHUNK_MS = int(os.environ.get("STREAM_CHUNK_MS", 10))
+
+# Keep proxies (nginx, Cloudflare) from buffering token-by-token output
+_STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+    "Content-Encoding": "identity"
+}
+
+@functools.lru_cache(maxsize=1)
 def get_cerebras_client():
     api_key = os.environ.get("CEREBRAS_API_KEY")
     if not api_key:
         raise ValueError("CEREBRAS_API_KEY environment variable is required")
-    
-    try:
-        # Try basic initialization first
-        return Cerebras(api_key=api_key)
-    except Exception as e:
-        # If that fails, try with minimal params
-        try:
-            from cerebras.cloud.sdk._base_client import DEFAULT_MAX_RETRIES, DEFAULT_TIMEOUT
-            return Cerebras(
-                api_key=api_key,
-                max_retries=DEFAULT_MAX_RETRIES,
-                timeout=DEFAULT_TIMEOUT
-            )
-        except Exception as e2:
-            # Last resort - try with no optional params
-            import cerebras.cloud.sdk._client as client_module
-            client_cls = getattr(client_module, 'Cerebras')
-            return client_cls(api_key=api_key)
+
+    return AsyncCerebras(api_key=api_key)
+
+@app.on_event("startup")
+async def init_cerebras_client():
+    # Build the client once up front so a bad API key fails fast
+    get_cerebras_client()
 
 class Message(BaseModel):
     role: str
@@ -45,41 +51,36 @@ class ChatRequest(BaseModel):
     temperature: Optional[float] = 0.7
     top_p: Optional[float] = 0.8
 
-class Choice(BaseModel):
-    index: int
-    message: Optional[Dict] = None
-    delta: Optional[Dict] = None
-    finish_reason: Optional[str] = None
-
-class Usage(BaseModel):
-    prompt_tokens: int
-    completion_tokens: int
-    total_tokens: int
-
-class ChatResponse(BaseModel):
-    id: str
-    object: str
-    created: int
-    model: str
-    choices: List[Choice]
-    usage: Optional[Usage] = None
+def _const_json(payload: Dict):
+    """Serialize a per-process-constant payload once, with an ETag."""
+    body = _dumps(payload)
+    return body, f'"{hashlib.md5(body).hexdigest()}"'
+
+def _const_response(request: Request, body: bytes, etag: str) -> Response:
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+_ROOT_BYTES, _ROOT_ETAG = _const_json({"message": "Cerebras-Ollama API Wrapper"})
+
+_TAGS_BYTES, _TAGS_ETAG = _const_json({
+    "models": [
+        {
+            "name": os.environ.get("CAI_MODEL", "qwen-3-235b-a22b-instruct-2507"),
+            "modified_at": "2024-01-01T00:00:00Z",
+            "size": 0,
+            "digest": "sha256:dummy"
+        }
+    ]
+})
 
 @app.get("/")
-async def root():
-    return {"message": "Cerebras-Ollama API Wrapper"}
+async def root(request: Request):
+    return _const_response(request, _ROOT_BYTES, _ROOT_ETAG)
 
 @app.get("/api/tags")
-async def list_models():
-    return {
-        "models": [
-            {
-                "name": os.environ.get("CAI_MODEL", "qwen-3-235b-a22b-instruct-2507"),
-                "modified_at": "2024-01-01T00:00:00Z",
-                "size": 0,
-                "digest": "sha256:dummy"
-            }
-        ]
-    }
+async def list_models(request: Request):
+    return _const_response(request, _TAGS_BYTES, _TAGS_ETAG)
 
 async def generate_streaming_response(
     messages: List[Dict], 
@@ -87,13 +88,12 @@ async def generate_streaming_response(
     temperature: float = 0.7,
     top_p: float = 0.8,
     max_tokens: int = 20000
-) -> AsyncGenerator[str, None]:
+) -> AsyncGenerator[bytes, None]:
     try:
         client = get_cerebras_client()
-        cerebras_messages = [{"role": msg["role"], "content": msg["content"]} for msg in messages]
-        
-        stream = client.chat.completions.create(
-            messages=cerebras_messages,
+
+        stream = await client.chat.completions.create(
+            messages=messages,
             model=os.environ.get("CAI_MODEL", model),
             stream=True,
             max_completion_tokens=max_tokens,
@@ -102,24 +102,35 @@ async def generate_streaming_response(
         )
         
         created_time = int(time.time())
-        chat_id = f"chatcmpl-{int(time.time() * 1000)}"
-        
-        for chunk in stream:
+        chat_id = f"chatcmpl-{time.time_ns() // 1_000_000}"
+
+        # Only delta.content varies per chunk, so build the byte template once
+        # and splice each token in instead of serializing a full dict per token
+        # model is client-supplied: JSON-encode it rather than interpolating
+        # it raw, so quotes/backslashes can't break or inject into the chunk
+        model_json = _dumps(model).decode()
+        chunk_prefix = (
+            f'data: {{"id":"{chat_id}","object":"chat.completion.chunk",'
+            f'"created":{created_time},"model":{model_json},'
+            '"choices":[{"index":0,"delta":{"content":'
+        ).encode()
+        chunk_suffix = b'},"finish_reason":null}]}\n\n'
+
+        pending = []
+        last_flush = time.monotonic()
+        flush_window = STREAM_CHUNK_MS / 1000.0
+
+        async for chunk in stream:
             if chunk.choices and chunk.choices[0].delta.content:
-                ollama_chunk = {
-                    "id": chat_id,
-                    "object": "chat.completion.chunk",
-                    "created": created_time,
-                    "model": model,
-                    "choices": [{
-                        "index": 0,
-                        "delta": {
-                            "content": chunk.choices[0].delta.content
-                        },
-                        "finish_reason": None
-                    }]
-                }
-                yield f"data: {json.dumps(ollama_chunk)}\n\n"
+                pending.append(chunk.choices[0].delta.content)
+                now = time.monotonic()
+                if len(pending) >= STREAM_CHUNK_TOKENS or now - last_flush > flush_window:
+                    yield chunk_prefix + _dumps("".join(pending)) + chunk_suffix
+                    pending.clear()
+                    last_flush = now
+
+        if pending:
+            yield chunk_prefix + _dumps("".join(pending)) + chunk_suffix
         
         final_chunk = {
             "id": chat_id,
@@ -132,8 +143,8 @@ async def generate_streaming_response(
                 "finish_reason": "stop"
             }]
         }
-        yield f"data: {json.dumps(final_chunk)}\n\n"
-        yield "data: [DONE]\n\n"
+        yield b"data: " + _dumps(final_chunk) + b"\n\n"
+        yield b"data: [DONE]\n\n"
         
     except Exception as e:
         error_chunk = {
@@ -142,13 +153,22 @@ async def generate_streaming_response(
                 "type": "api_error"
             }
         }
-        yield f"data: {json.dumps(error_chunk)}\n\n"
+        yield b"data: " + _dumps(error_chunk, option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
 
 @app.post("/api/chat")
 @app.post("/v1/chat/completions")
-async def chat_completions(request: ChatRequest):
+async def chat_completions(raw_request: Request):
+    # model_validate_json goes straight from body bytes to the model in
+    # pydantic-core, skipping FastAPI's intermediate json.loads/dict pass
+    try:
+        request = ChatRequest.model_validate_json(await raw_request.body())
+    except ValidationError as e:
+        # include_input=False: json_invalid errors carry the raw body as
+        # bytes, which the default exception handler cannot serialize
+        raise HTTPException(status_code=422, detail=e.errors(include_input=False, include_url=False))
+
     try:
-        messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+        messages = [m.__dict__ for m in request.messages]
         
         if request.stream:
             return StreamingResponse(
@@ -159,15 +179,14 @@ async def chat_completions(request: ChatRequest):
                     request.top_p,
                     request.max_tokens
                 ),
-                media_type="text/plain",
-                headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
+                media_type="text/event-stream",
+                headers=_STREAM_HEADERS
             )
         else:
             client = get_cerebras_client()
-            cerebras_messages = [{"role": msg["role"], "content": msg["content"]} for msg in messages]
-            
-            completion = client.chat.completions.create(
-                messages=cerebras_messages,
+
+            completion = await client.chat.completions.create(
+                messages=messages,
                 model=os.environ.get("CAI_MODEL", request.model),
                 stream=False,
                 max_completion_tokens=request.max_tokens,
@@ -175,12 +194,12 @@ async def chat_completions(request: ChatRequest):
                 top_p=request.top_p
             )
             
-            return ChatResponse(
-                id=f"chatcmpl-{int(time.time() * 1000)}",
-                object="chat.completion",
-                created=int(time.time()),
-                model=request.model,
-                choices=[{
+            return ORJSONResponse({
+                "id": f"chatcmpl-{time.time_ns() // 1_000_000}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.model,
+                "choices": [{
                     "index": 0,
                     "message": {
                         "role": "assistant",
@@ -188,14 +207,22 @@ async def chat_completions(request: ChatRequest):
                     },
                     "finish_reason": "stop"
                 }],
-                usage=Usage(
-                    prompt_tokens=0,
-                    completion_tokens=0,
-                    total_tokens=0
-                )
-            )
+                "usage": {
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "total_tokens": 0
+                }
+            })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=6000)
\ No newline at end of file
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=6000,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        log_level="warning"
+    )
\ No newline at end of file
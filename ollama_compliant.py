@@ -1,15 +1,56 @@
 import os
 import time
-import json
+import hashlib
+import logging
+import orjson
 import httpx
 from datetime import datetime, timezone
 from typing import Dict, List, Optional, AsyncGenerator
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
 import uvicorn
 
-app = FastAPI(title="Cerebras-Ollama Wrapper", version="1.0.0")
+from sse_transcode import SSE_DATA_PREFIX, SSE_DONE, extract_content
+
+app = FastAPI(title="Cerebras-Ollama Wrapper", version="1.0.0", default_response_class=ORJSONResponse)
+
+_dumps = orjson.dumps
+
+# Keep proxies (nginx, Cloudflare) from buffering token-by-token output
+_STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+    "Content-Encoding": "identity"
+}
+
+CEREBRAS_CLIENT: httpx.AsyncClient | None = None
+_HEADERS: Dict | None = None
+_STREAM_UPSTREAM_HEADERS: Dict | None = None
+
+@app.on_event("startup")
+async def open_cerebras_client():
+    global CEREBRAS_CLIENT, _HEADERS, _STREAM_UPSTREAM_HEADERS
+    CEREBRAS_CLIENT = httpx.AsyncClient(
+        base_url="https://api.cerebras.ai",
+        http2=True,
+        timeout=httpx.Timeout(60.0, connect=5.0),
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100)
+    )
+    api_key = os.environ.get("CEREBRAS_API_KEY")
+    if api_key:
+        _HEADERS = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        # Streams skip gzip so tokens aren't decompressed just to re-serialize
+        _STREAM_UPSTREAM_HEADERS = {**_HEADERS, "Accept-Encoding": "identity"}
+
+@app.on_event("shutdown")
+async def close_cerebras_client():
+    if CEREBRAS_CLIENT is not None:
+        await CEREBRAS_CLIENT.aclose()
 
 class Message(BaseModel):
     role: str
@@ -29,15 +70,118 @@ class GenerateRequest(BaseModel):
     context: Optional[List[int]] = None
     options: Optional[Dict] = {}
 
+_CAI_MODEL = os.environ.get("CAI_MODEL", "qwen-3-235b-a22b-instruct-2507")
+_MODEL_NAME = _CAI_MODEL.split("-")[0]
+_MODEL_TAG = f"{_MODEL_NAME}:latest"
+
+# Coalesce upstream deltas so fast generation doesn't mean one write per token
+STREAM_CHUNK_TOKENS = int(os.environ.get("STREAM_CHUNK_TOKENS", 8))
+STREAM_CHUNK_MS = int(os.environ.get("STREAM_CHUNK_MS", 10))
+
+logger = logging.getLogger("cerollama")
+_logged_http_version = False
+
+def _const_json(payload: Dict):
+    """Serialize a per-process-constant payload once, with an ETag."""
+    body = _dumps(payload)
+    return body, f'"{hashlib.md5(body).hexdigest()}"'
+
+def _const_response(request: Request, body: bytes, etag: str) -> Response:
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+_ROOT_BYTES, _ROOT_ETAG = _const_json({"message": "Ollama is running"})
+
+_VERSION_BYTES, _VERSION_ETAG = _const_json({"version": "0.1.17"})
+
+_TAGS_BYTES, _TAGS_ETAG = _const_json({
+    "models": [
+        {
+            "name": _MODEL_TAG,
+            "model": _MODEL_TAG,
+            "modified_at": "2024-01-01T10:00:00Z",
+            "size": 4_800_000_000,
+            "digest": "sha256:abcd1234",
+            "details": {
+                "parent_model": "",
+                "format": "gguf",
+                "family": _MODEL_NAME,
+                "families": [_MODEL_NAME],
+                "parameter_size": "7B",
+                "quantization_level": "Q4_0"
+            }
+        }
+    ]
+})
+
+_SHOW_BYTES, _SHOW_ETAG = _const_json({
+    "license": "Apache 2.0",
+    "modelfile": f"FROM {_MODEL_TAG}",
+    "parameters": "temperature 0.7\ntop_p 0.8",
+    "template": "{{ .System }}{{ .Prompt }}",
+    "details": {
+        "parent_model": "",
+        "format": "gguf",
+        "family": _MODEL_NAME,
+        "families": [_MODEL_NAME],
+        "parameter_size": "7B",
+        "quantization_level": "Q4_0"
+    }
+})
+
+_PS_BYTES, _PS_ETAG = _const_json({
+    "models": [
+        {
+            "name": _MODEL_TAG,
+            "model": _MODEL_TAG,
+            "size": 4_800_000_000,
+            "digest": "sha256:abcd1234",
+            "expires_at": "2024-12-31T23:59:59Z"
+        }
+    ]
+})
+
 def get_iso_timestamp():
     return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
 
-def get_model_name():
-    return os.environ.get("CAI_MODEL", "qwen-3-235b-a22b-instruct-2507").split("-")[0]
+def _build_payload(messages: List[Dict], stream: bool) -> bytes:
+    # Pre-serialized so httpx doesn't re-encode the body
+    return _dumps({
+        "model": _CAI_MODEL,
+        "messages": messages,
+        "stream": stream,
+        "max_completion_tokens": 20000,
+        "temperature": 0.7,
+        "top_p": 0.8
+    })
+
+def _require_upstream():
+    if _HEADERS is None:
+        raise ValueError("CEREBRAS_API_KEY environment variable is required")
+
+async def _cerebras_post(messages: List[Dict]) -> Dict:
+    _require_upstream()
+    response = await CEREBRAS_CLIENT.post(
+        "/v1/chat/completions",
+        headers=_HEADERS,
+        content=_build_payload(messages, stream=False)
+    )
+    response.raise_for_status()
+    return response.json()
+
+def _cerebras_stream(messages: List[Dict]):
+    _require_upstream()
+    return CEREBRAS_CLIENT.stream(
+        "POST",
+        "/v1/chat/completions",
+        headers=_STREAM_UPSTREAM_HEADERS,
+        content=_build_payload(messages, stream=True)
+    )
 
 def get_timing_metrics():
     return {
-        "total_duration": int(time.time() * 1_000_000_000),
+        "total_duration": time.time_ns(),
         "load_duration": 1_000_000,
         "prompt_eval_count": 10,
         "prompt_eval_duration": 50_000_000,
@@ -46,148 +190,105 @@ def get_timing_metrics():
     }
 
 @app.get("/")
-async def root():
-    return {"message": "Ollama is running"}
+async def root(request: Request):
+    return _const_response(request, _ROOT_BYTES, _ROOT_ETAG)
 
 @app.get("/api/version")
-async def version():
-    return {"version": "0.1.17"}
+async def version(request: Request):
+    return _const_response(request, _VERSION_BYTES, _VERSION_ETAG)
 
 @app.get("/api/tags")
-async def list_models():
-    model_name = get_model_name()
-    return {
-        "models": [
-            {
-                "name": f"{model_name}:latest",
-                "model": f"{model_name}:latest", 
-                "modified_at": "2024-01-01T10:00:00Z",
-                "size": 4_800_000_000,
-                "digest": "sha256:abcd1234",
-                "details": {
-                    "parent_model": "",
-                    "format": "gguf",
-                    "family": model_name,
-                    "families": [model_name],
-                    "parameter_size": "7B",
-                    "quantization_level": "Q4_0"
-                }
-            }
-        ]
-    }
+async def list_models(request: Request):
+    return _const_response(request, _TAGS_BYTES, _TAGS_ETAG)
 
 @app.post("/api/show")
-async def show_model(request: dict):
-    model_name = get_model_name()
-    return {
-        "license": "Apache 2.0",
-        "modelfile": f"FROM {model_name}:latest",
-        "parameters": "temperature 0.7\ntop_p 0.8",
-        "template": "{{ .System }}{{ .Prompt }}",
-        "details": {
-            "parent_model": "",
-            "format": "gguf", 
-            "family": model_name,
-            "families": [model_name],
-            "parameter_size": "7B",
-            "quantization_level": "Q4_0"
-        }
-    }
+async def show_model(request: Request):
+    return _const_response(request, _SHOW_BYTES, _SHOW_ETAG)
 
 @app.get("/api/ps")
-async def running_models():
-    model_name = get_model_name()
-    return {
-        "models": [
-            {
-                "name": f"{model_name}:latest",
-                "model": f"{model_name}:latest",
-                "size": 4_800_000_000,
-                "digest": "sha256:abcd1234",
-                "expires_at": "2024-12-31T23:59:59Z"
-            }
-        ]
-    }
+async def running_models(request: Request):
+    return _const_response(request, _PS_BYTES, _PS_ETAG)
 
 async def generate_ollama_streaming_response(
     messages: List[Dict], 
     model: str,
     is_generate: bool = False,
     prompt: str = None
-) -> AsyncGenerator[str, None]:
+) -> AsyncGenerator[bytes, None]:
     try:
-        api_key = os.environ.get("CEREBRAS_API_KEY")
-        if not api_key:
-            raise ValueError("CEREBRAS_API_KEY environment variable is required")
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
         if is_generate and prompt:
             cerebras_messages = [{"role": "user", "content": prompt}]
         else:
             cerebras_messages = messages
-            
-        payload = {
-            "model": os.environ.get("CAI_MODEL", "qwen-3-235b-a22b-instruct-2507"),
-            "messages": cerebras_messages,
-            "stream": True,
-            "max_completion_tokens": 20000,
-            "temperature": 0.7,
-            "top_p": 0.8
-        }
-        
-        model_name = get_model_name()
-        
-        async with httpx.AsyncClient() as client:
-            async with client.stream(
-                "POST", 
-                "https://api.cerebras.ai/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60.0
-            ) as response:
-                async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        data = line[6:]
-                        if data == "[DONE]":
-                            break
-                        
-                        try:
-                            chunk_data = json.loads(data)
-                            if chunk_data.get("choices") and chunk_data["choices"][0].get("delta", {}).get("content"):
-                                content = chunk_data["choices"][0]["delta"]["content"]
-                                
-                                if is_generate:
-                                    ollama_chunk = {
-                                        "model": f"{model_name}:latest",
-                                        "created_at": get_iso_timestamp(),
-                                        "response": content,
-                                        "done": False
-                                    }
-                                else:
-                                    ollama_chunk = {
-                                        "model": f"{model_name}:latest",
-                                        "created_at": get_iso_timestamp(),
-                                        "message": {
-                                            "role": "assistant",
-                                            "content": content
-                                        },
-                                        "done": False
-                                    }
-                                
-                                yield json.dumps(ollama_chunk) + "\n"
-                        except json.JSONDecodeError:
-                            continue
+
+        created_at = get_iso_timestamp()
+
+        # Only the content varies per chunk, so build the byte template once
+        # and splice each token in instead of serializing a full dict per token
+        if is_generate:
+            chunk_prefix = (
+                f'{{"model":"{_MODEL_TAG}","created_at":"{created_at}","response":'
+            ).encode()
+            chunk_suffix = b',"done":false}\n'
+        else:
+            chunk_prefix = (
+                f'{{"model":"{_MODEL_TAG}","created_at":"{created_at}",'
+                '"message":{"role":"assistant","content":'
+            ).encode()
+            chunk_suffix = b'},"done":false}\n'
+
+        async with _cerebras_stream(cerebras_messages) as response:
+            # One-time check that the pooled client actually negotiated h2;
+            # warning level so it clears the unconfigured-logger threshold
+            global _logged_http_version
+            if not _logged_http_version:
+                if response.http_version != "HTTP/2":
+                    logger.warning(
+                        "Cerebras upstream negotiated %s instead of HTTP/2; "
+                        "concurrent streams will not multiplex", response.http_version
+                    )
+                _logged_http_version = True
+            # Read large byte chunks and split SSE events ourselves; cheaper
+            # than aiter_lines decoding and line-splitting in Python per token
+            buf = bytearray()
+            done = False
+            pending = []
+            last_flush = time.monotonic()
+            flush_window = STREAM_CHUNK_MS / 1000.0
+            async for data in response.aiter_bytes(65536):
+                buf += data
+                while (idx := buf.find(b"\n\n")) != -1:
+                    event = bytes(buf[:idx])
+                    del buf[:idx + 2]
+                    if event[:6] != SSE_DATA_PREFIX:
+                        continue
+                    payload = event[6:]
+                    if payload == SSE_DONE:
+                        done = True
+                        break
+
+                    content = extract_content(payload)
+                    if content is None:
+                        continue
+
+                    pending.append(content)
+                    now = time.monotonic()
+                    if len(pending) >= STREAM_CHUNK_TOKENS or now - last_flush > flush_window:
+                        yield chunk_prefix + _dumps("".join(pending)) + chunk_suffix
+                        pending.clear()
+                        last_flush = now
+                if done:
+                    break
+
+            if pending:
+                yield chunk_prefix + _dumps("".join(pending)) + chunk_suffix
         
         # Final chunk
         timing = get_timing_metrics()
         if is_generate:
             final_chunk = {
-                "model": f"{model_name}:latest", 
-                "created_at": get_iso_timestamp(),
+                "model": _MODEL_TAG,
+                "created_at": created_at,
                 "response": "",
                 "done": True,
                 "done_reason": "stop",
@@ -196,8 +297,8 @@ async def generate_ollama_streaming_response(
             }
         else:
             final_chunk = {
-                "model": f"{model_name}:latest",
-                "created_at": get_iso_timestamp(), 
+                "model": _MODEL_TAG,
+                "created_at": created_at,
                 "message": {
                     "role": "assistant",
                     "content": ""
@@ -207,16 +308,25 @@ async def generate_ollama_streaming_response(
                 **timing
             }
         
-        yield json.dumps(final_chunk) + "\n"
-        
+        yield _dumps(final_chunk) + b"\n"
+
     except Exception as e:
         error_chunk = {
             "error": str(e)
         }
-        yield json.dumps(error_chunk) + "\n"
+        yield _dumps(error_chunk, option=orjson.OPT_NON_STR_KEYS) + b"\n"
 
 @app.post("/api/generate")
-async def generate(request: GenerateRequest):
+async def generate(raw_request: Request):
+    # model_validate_json goes straight from body bytes to the model in
+    # pydantic-core, skipping FastAPI's intermediate json.loads/dict pass
+    try:
+        request = GenerateRequest.model_validate_json(await raw_request.body())
+    except ValidationError as e:
+        # include_input=False: json_invalid errors carry the raw body as
+        # bytes, which the default exception handler cannot serialize
+        raise HTTPException(status_code=422, detail=e.errors(include_input=False, include_url=False))
+
     try:
         if request.stream:
             return StreamingResponse(
@@ -227,60 +337,41 @@ async def generate(request: GenerateRequest):
                     prompt=request.prompt
                 ),
                 media_type="application/x-ndjson",
-                headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
+                headers=_STREAM_HEADERS
             )
         else:
-            api_key = os.environ.get("CEREBRAS_API_KEY")
-            if not api_key:
-                raise HTTPException(status_code=500, detail="CEREBRAS_API_KEY environment variable is required")
-            
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            }
-            
             messages = []
             if request.system:
                 messages.append({"role": "system", "content": request.system})
             messages.append({"role": "user", "content": request.prompt})
-            
-            payload = {
-                "model": os.environ.get("CAI_MODEL", "qwen-3-235b-a22b-instruct-2507"),
-                "messages": messages,
-                "stream": False,
-                "max_completion_tokens": 20000,
-                "temperature": 0.7,
-                "top_p": 0.8
-            }
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://api.cerebras.ai/v1/chat/completions",
-                    headers=headers,
-                    json=payload
-                )
-                response.raise_for_status()
-                completion_data = response.json()
-            
-            model_name = get_model_name()
+
+            completion_data = await _cerebras_post(messages)
+
             timing = get_timing_metrics()
             
-            return {
-                "model": f"{model_name}:latest",
+            return ORJSONResponse({
+                "model": _MODEL_TAG,
                 "created_at": get_iso_timestamp(),
                 "response": completion_data["choices"][0]["message"]["content"],
                 "done": True,
-                "done_reason": "stop", 
+                "done_reason": "stop",
                 "context": [1, 2, 3, 4, 5],
                 **timing
-            }
+            })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/chat")
-async def chat_completions(request: ChatRequest):
+async def chat_completions(raw_request: Request):
+    try:
+        request = ChatRequest.model_validate_json(await raw_request.body())
+    except ValidationError as e:
+        # include_input=False: json_invalid errors carry the raw body as
+        # bytes, which the default exception handler cannot serialize
+        raise HTTPException(status_code=422, detail=e.errors(include_input=False, include_url=False))
+
     try:
-        messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+        messages = [m.__dict__ for m in request.messages]
         
         if request.stream:
             return StreamingResponse(
@@ -289,42 +380,16 @@ async def chat_completions(request: ChatRequest):
                     request.model,
                     is_generate=False
                 ),
-                media_type="application/x-ndjson", 
-                headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
+                media_type="application/x-ndjson",
+                headers=_STREAM_HEADERS
             )
         else:
-            api_key = os.environ.get("CEREBRAS_API_KEY")
-            if not api_key:
-                raise HTTPException(status_code=500, detail="CEREBRAS_API_KEY environment variable is required")
-            
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": os.environ.get("CAI_MODEL", "qwen-3-235b-a22b-instruct-2507"),
-                "messages": messages,
-                "stream": False,
-                "max_completion_tokens": 20000,
-                "temperature": 0.7,
-                "top_p": 0.8
-            }
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://api.cerebras.ai/v1/chat/completions",
-                    headers=headers,
-                    json=payload
-                )
-                response.raise_for_status()
-                completion_data = response.json()
-            
-            model_name = get_model_name()
+            completion_data = await _cerebras_post(messages)
+
             timing = get_timing_metrics()
             
-            return {
-                "model": f"{model_name}:latest",
+            return ORJSONResponse({
+                "model": _MODEL_TAG,
                 "created_at": get_iso_timestamp(),
                 "message": {
                     "role": "assistant",
@@ -333,9 +398,17 @@ async def chat_completions(request: ChatRequest):
                 "done": True,
                 "done_reason": "stop",
                 **timing
-            }
+            })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=6000)
\ No newline at end of file
+    uvicorn.run(
+        "ollama_compliant:app",
+        host="0.0.0.0",
+        port=6000,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        log_level="warning"
+    )
\ No newline at end of file
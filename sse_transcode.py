@@ -0,0 +1,29 @@
+"""Hot-path helpers for the SSE -> NDJSON transcoder.
+
+The per-token work (parse the upstream JSON event and pull out the
+delta content) lives here so it can be compiled to a C extension. The
+module works as plain Python; for the compiled version run:
+
+    pip install mypy
+    mypyc sse_transcode.py
+
+and the import in ollama_compliant.py picks up the extension
+automatically.
+"""
+from typing import Final, Optional
+
+import orjson
+
+SSE_DATA_PREFIX: Final[bytes] = b"data: "
+SSE_DONE: Final[bytes] = b"[DONE]"
+
+
+def extract_content(payload: bytes) -> Optional[str]:
+    """Return the delta content of one event payload, or None to skip it."""
+    try:
+        content = orjson.loads(payload)["choices"][0]["delta"]["content"]
+    except (orjson.JSONDecodeError, KeyError, IndexError, TypeError):
+        return None
+    if not isinstance(content, str) or not content:
+        return None
+    return content
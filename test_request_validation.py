@@ -0,0 +1,21 @@
+from fastapi.testclient import TestClient
+
+import ollama_compliant
+
+
+def test_chat_malformed_body_returns_422():
+    with TestClient(ollama_compliant.app) as client:
+        response = client.post("/api/chat", content=b'{"bad json')
+        assert response.status_code == 422
+
+
+def test_chat_empty_body_returns_422():
+    with TestClient(ollama_compliant.app) as client:
+        response = client.post("/api/chat", content=b"")
+        assert response.status_code == 422
+
+
+def test_generate_malformed_body_returns_422():
+    with TestClient(ollama_compliant.app) as client:
+        response = client.post("/api/generate", content=b'{"bad json')
+        assert response.status_code == 422